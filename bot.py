@@ -1,7 +1,10 @@
 # bot.py — Telegram-бот: меню /start, группировка /gpupirovka, форматирование /format,
-# перезапуск /reset, НОВОЕ: нормализация «тональности» /tonalnost
+# перезапуск /reset, НОВОЕ: нормализация «тональности» /tonalnost, подбор параметров /podbor
 import os
+import asyncio
 import logging
+import pickle
+from copy import deepcopy
 from pathlib import Path
 
 from telegram import Update, ReplyKeyboardMarkup, KeyboardButton
@@ -11,12 +14,15 @@ from telegram.ext import (
     MessageHandler,
     ConversationHandler,
     ContextTypes,
+    BasePersistence,
+    PersistenceInput,
     filters,
 )
 
-from token_packer import pack, normalize_tokens
-from text_formatter import process_text
+from token_packer import pack, normalize_tokens, sweep
+from text_formatter import parse_text, render_text
 from tonalnost_formatter import normalize_message  # <-- НОВОЕ
+from session_store import SessionStore
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -27,12 +33,28 @@ LEFT, RIGHT, MINLEN, MAXLEN, SEPARATOR = range(5)
 FMT_TEXT, FMT_N = range(5, 7)
 # Состояния тональности
 TON_TEXT = 7  # один шаг ввода текста
+# Состояния подбора параметров группировки
+SW_LEFT, SW_RIGHT, SW_MIN, SW_MAX, SW_SEP = range(8, 13)
+SWEEP_MAX_COMBOS = 2000
+
+CONVERSATION_TIMEOUT = 600
+# Состояние незавершённых диалогов: компактно, с вытеснением и лимитом памяти.
+# SESSION_STATE_PATH — файл для сохранения между перезапусками (необязательно);
+# раз в SESSION_REPORT_INTERVAL секунд — отчёт о памяти в лог и запись файла.
+_STATE_PATH = os.getenv("SESSION_STATE_PATH")
+HOUSEKEEPING_INTERVAL = int(os.getenv("SESSION_REPORT_INTERVAL", "60"))
+SESSIONS = SessionStore(
+    idle_ttl=CONVERSATION_TIMEOUT,
+    max_bytes=int(os.getenv("SESSION_MAX_BYTES", str(64 * 1024 * 1024))),
+)
+_housekeeping_task: asyncio.Task | None = None
 
 def _kb_main():
     return ReplyKeyboardMarkup(
         [
             [KeyboardButton("/gpupirovka"), KeyboardButton("/format")],
-            [KeyboardButton("/tonalnost"), KeyboardButton("/reset")],
+            [KeyboardButton("/tonalnost"), KeyboardButton("/podbor")],
+            [KeyboardButton("/reset")],
         ],
         resize_keyboard=True,
         one_time_keyboard=False,
@@ -46,14 +68,60 @@ def _auto_wrap_separator(sep: str) -> str:
         return f"){s}("
     return s
 
+def _parse_range(text: str) -> range:
+    """'480' -> одно значение; '400-500' -> шаг 10; '400-500/20' -> шаг 20."""
+    s = (text or "").replace(" ", "")
+    step = 10
+    if "/" in s:
+        s, step_str = s.split("/", 1)
+        step = int(step_str)
+    if "-" in s:
+        lo, hi = (int(x) for x in s.split("-", 1))
+    else:
+        lo = hi = int(s)
+    if step <= 0 or lo > hi:
+        raise ValueError(s)
+    return range(lo, hi + 1, step)
+
+async def _pack_flow_start(update: Update, title: str, first_state: int) -> int:
+    """Начало /gpupirovka и /podbor: новая сессия и запрос левой части."""
+    SESSIONS.drop(update.effective_user.id)
+    await update.message.reply_text(
+        f"{title}\nВведи ЛЕВУЮ часть (фиксированный список слов):",
+        reply_markup=_kb_main(),
+    )
+    return first_state
+
+async def _tokens_input(
+    update: Update, key: str, state: int, next_state: int, next_prompt: str
+) -> int:
+    """Разбирает и сохраняет левую/правую часть (key = "left"/"right")."""
+    tokens = normalize_tokens([update.message.text])
+    if not tokens:
+        part = "Левая" if key == "left" else "Правая"
+        await update.message.reply_text(f"{part} часть пустая. Введите хотя бы одно слово:")
+        return state
+    SESSIONS.put_tokens(update.effective_user.id, key, tokens)
+    await update.message.reply_text(next_prompt)
+    return next_state
+
+async def _session_expired(update: Update, first_state: int) -> int:
+    """Данные диалога вытеснены (лимит памяти/перезапуск) — начинаем заново."""
+    SESSIONS.drop(update.effective_user.id)
+    await update.message.reply_text(
+        "Сессия устарела, начнём заново.\nВведи ЛЕВУЮ часть (фиксированный список слов):"
+    )
+    return first_state
+
 # ========================== /start ==========================
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    context.user_data.clear()
+    SESSIONS.drop(update.effective_user.id)
     txt = (
         "👋 Привет! Доступны режимы:\n\n"
         "• /gpupirovka — ГРУППИРОВКА:  Собирает длинные списки ключей в пары скобок так, чтобы каждая пара укладывалась в лимит ~512 символов.\n"
         "• /format — ФОРМАТИРОВАНИЕ: Форматирует список слов под формат поискового запроса.\n"
         "• /tonalnost — ТОНАЛЬНОСТЬ: Приводит слова к правильному формату для объекта тональности. —\n"
+        "• /podbor — ПОДБОР: Сравнивает диапазоны min/max и разделители для группировки одной таблицей.\n"
         "В любой момент нажмите /reset, чтобы вернуться в это меню."
     )
     await update.message.reply_text(txt, reply_markup=_kb_main())
@@ -61,32 +129,21 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 # ========================== ГРУППИРОВКА ==========================
 async def gpupirovka_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    context.user_data.clear()
-    await update.message.reply_text(
-        "Режим ГРУППИРОВКИ.\nВведи ЛЕВУЮ часть (фиксированный список слов):",
-        reply_markup=_kb_main(),
-    )
-    return LEFT
+    return await _pack_flow_start(update, "Режим ГРУППИРОВКИ.", LEFT)
 
 async def left_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    context.user_data["left"] = normalize_tokens([update.message.text])
-    if not context.user_data["left"]:
-        await update.message.reply_text("Левая часть пустая. Введите хотя бы одно слово:")
-        return LEFT
-    await update.message.reply_text("Отлично! Теперь введи ПРАВУЮ часть (плавающий список слов):")
-    return RIGHT
+    return await _tokens_input(
+        update, "left", LEFT, RIGHT, "Отлично! Теперь введи ПРАВУЮ часть (плавающий список слов):"
+    )
 
 async def right_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    context.user_data["right"] = normalize_tokens([update.message.text])
-    if not context.user_data["right"]:
-        await update.message.reply_text("Правая часть пустая. Введите хотя бы одно слово:")
-        return RIGHT
-    await update.message.reply_text("Введи минимальную длину конструкции (например 480):")
-    return MINLEN
+    return await _tokens_input(
+        update, "right", RIGHT, MINLEN, "Введи минимальную длину конструкции (например 480):"
+    )
 
 async def minlen_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
-        context.user_data["min_len"] = int(update.message.text)
+        SESSIONS.put(update.effective_user.id, "min_len", int(update.message.text))
     except ValueError:
         await update.message.reply_text("Ошибка! Введи число (например 480):")
         return MINLEN
@@ -94,25 +151,35 @@ async def minlen_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return MAXLEN
 
 async def maxlen_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    uid = update.effective_user.id
     try:
-        context.user_data["max_len"] = int(update.message.text)
+        max_len = int(update.message.text)
     except ValueError:
         await update.message.reply_text("Ошибка! Введи число (например 512):")
         return MAXLEN
-    if context.user_data["min_len"] > context.user_data["max_len"]:
+    min_len = SESSIONS.get(uid, "min_len")
+    if min_len is None:
+        return await _session_expired(update, LEFT)
+    if min_len > max_len:
         await update.message.reply_text("min_len не может быть больше max_len. Введите max_len ещё раз:")
         return MAXLEN
+    SESSIONS.put(uid, "max_len", max_len)
     await update.message.reply_text(
         "Теперь введи разделитель (например ')*(' или ')/1(' — скобочки можно не писать):"
     )
     return SEPARATOR
 
 async def separator_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    ud = context.user_data
+    uid = update.effective_user.id
     separator = _auto_wrap_separator(update.message.text)
-    ud["separator"] = separator
+    left = SESSIONS.get_tokens(uid, "left")
+    right = SESSIONS.get_tokens(uid, "right")
+    min_len = SESSIONS.get(uid, "min_len")
+    max_len = SESSIONS.get(uid, "max_len")
+    if not left or not right or min_len is None or max_len is None:
+        return await _session_expired(update, LEFT)
     try:
-        results = pack(ud["left"], ud["right"], ud["min_len"], ud["max_len"], separator)
+        results = pack(left, right, min_len, max_len, separator)
         out_text = ", ".join(results)
         if len(out_text) > 4000:
             path = f"result_{update.effective_user.id}.txt"
@@ -128,11 +195,110 @@ async def separator_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except Exception as e:
         logger.exception("Ошибка при упаковке")
         await update.message.reply_text(f"Ошибка: {e}")
+    SESSIONS.drop(uid)
+    return ConversationHandler.END
+
+# ========================== ПОДБОР ПАРАМЕТРОВ (/podbor) ==========================
+async def sweep_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    return await _pack_flow_start(update, "Режим ПОДБОРА параметров группировки.", SW_LEFT)
+
+async def sweep_left_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    return await _tokens_input(
+        update, "left", SW_LEFT, SW_RIGHT, "Теперь введи ПРАВУЮ часть (плавающий список слов):"
+    )
+
+async def sweep_right_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    return await _tokens_input(
+        update, "right", SW_RIGHT, SW_MIN,
+        "Введи диапазон min_len: '440-500' (шаг 10), '440-500/20' или одно число:",
+    )
+
+async def sweep_min_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    try:
+        mins = _parse_range(update.message.text)
+    except ValueError:
+        await update.message.reply_text("Ошибка! Пример: 440-500/20")
+        return SW_MIN
+    SESSIONS.put(update.effective_user.id, "min_range", (mins.start, mins.stop, mins.step))
+    await update.message.reply_text("Теперь диапазон max_len (например 480-512/16):")
+    return SW_MAX
+
+async def sweep_max_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    uid = update.effective_user.id
+    try:
+        maxs = _parse_range(update.message.text)
+    except ValueError:
+        await update.message.reply_text("Ошибка! Пример: 480-512/16")
+        return SW_MAX
+    min_range = SESSIONS.get(uid, "min_range")
+    if min_range is None:
+        return await _session_expired(update, SW_LEFT)
+    if maxs[-1] < min_range[0]:
+        await update.message.reply_text(
+            f"Все max_len меньше наименьшего min_len ({min_range[0]}). Введите диапазон max_len ещё раз:"
+        )
+        return SW_MAX
+    SESSIONS.put(uid, "max_range", (maxs.start, maxs.stop, maxs.step))
+    await update.message.reply_text(
+        "Введи разделители, по одному на строке (например '*' и '/1' — скобочки можно не писать):"
+    )
+    return SW_SEP
+
+async def sweep_sep_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    uid = update.effective_user.id
+    # По одному на строке — как в /gpupirovka, разделитель может содержать пробелы
+    sep_lines = [x for x in (update.message.text or "").splitlines() if x.strip()]
+    separators = list(dict.fromkeys(_auto_wrap_separator(x) for x in sep_lines))
+    separators = separators or [_auto_wrap_separator("")]
+    left = SESSIONS.get_tokens(uid, "left")
+    right = SESSIONS.get_tokens(uid, "right")
+    min_range = SESSIONS.get(uid, "min_range")
+    max_range = SESSIONS.get(uid, "max_range")
+    if not left or not right or min_range is None or max_range is None:
+        return await _session_expired(update, SW_LEFT)
+    mins = range(*min_range)
+    maxs = range(*max_range)
+    if len(mins) * len(maxs) * len(separators) > SWEEP_MAX_COMBOS:
+        await update.message.reply_text(
+            f"Слишком много комбинаций (больше {SWEEP_MAX_COMBOS}). Уменьшите диапазоны: /podbor"
+        )
+        SESSIONS.drop(uid)
+        return ConversationHandler.END
+    try:
+        rows = sweep(left, right, mins, maxs, separators)
+        # Лучшие сверху: меньше конструкций, плотнее заполнение
+        ok = sorted((r for r in rows if not r.error), key=lambda r: (r.count, -r.mean_fill))
+        lines = [
+            f"{r.min_len}-{r.max_len} {r.separator}: {r.count} шт., "
+            f"заполнение {r.mean_fill:.1%}, макс {r.longest}"
+            for r in ok
+        ]
+        lines += [f"{r.min_len}-{r.max_len} {r.separator}: {r.error}" for r in rows if r.error]
+        out_text = "\n".join(lines)
+        if len(out_text) > 4000:
+            out_path = Path(f"podbor_{uid}.txt")
+            out_path.write_text(out_text, encoding="utf-8")
+            try:
+                with open(out_path, "rb") as f:
+                    await update.message.reply_document(document=f, filename=out_path.name)
+            finally:
+                try:
+                    out_path.unlink(missing_ok=True)
+                except Exception:
+                    pass
+        else:
+            await update.message.reply_text(out_text)
+    except Exception as e:
+        logger.exception("Ошибка при подборе")
+        await update.message.reply_text(f"Ошибка: {e}")
+    SESSIONS.drop(uid)
     return ConversationHandler.END
 
 # ========================== ФОРМАТИРОВАНИЕ (/format) ==========================
 async def format_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    context.user_data.pop("fmt_text", None)
+    uid = update.effective_user.id
+    SESSIONS.pop(uid, "fmt_items")
+    SESSIONS.pop(uid, "fmt_flags")
     await update.message.reply_text(
         "Режим ФОРМАТИРОВАНИЯ.\nПришлите .txt файл ИЛИ вставьте текст сообщением (через запятую):",
         reply_markup=_kb_main(),
@@ -161,7 +327,14 @@ async def fmt_text_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not text or not text.strip():
         await update.message.reply_text("Пустой ввод. Пришлите .txt или вставьте текст сообщением:")
         return FMT_TEXT
-    context.user_data["fmt_text"] = text.strip()
+    # Разбираем один раз: дальше для любого N нужен только рендер
+    items, flags = parse_text(text.strip())
+    if not items:
+        await update.message.reply_text("Нет ни одного элемента. Пришлите .txt или вставьте текст сообщением:")
+        return FMT_TEXT
+    uid = update.effective_user.id
+    SESSIONS.put_tokens(uid, "fmt_items", items)
+    SESSIONS.put(uid, "fmt_flags", flags)
     await update.message.reply_text("Введите целое число N для тильды (по умолчанию 0):")
     return FMT_N
 
@@ -172,9 +345,14 @@ async def fmt_n_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except ValueError:
         await update.message.reply_text("Ошибка! Введите целое число N (например 0, 1, 2):")
         return FMT_N
-    text = context.user_data.get("fmt_text", "")
+    uid = update.effective_user.id
+    items = SESSIONS.get_tokens(uid, "fmt_items")
+    flags = SESSIONS.get(uid, "fmt_flags", b"")
+    if not items:
+        await update.message.reply_text("Сессия устарела. Пришлите .txt или вставьте текст сообщением заново:")
+        return FMT_TEXT
     try:
-        result, total, phrases, singles = process_text(text, n)
+        result, total, phrases, singles = render_text(items, flags, n)
         out_path = Path(f"formatted_{update.effective_user.id}.txt")
         out_path.write_text(result, encoding="utf-8")
         try:
@@ -192,8 +370,11 @@ async def fmt_n_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except Exception as e:
         logger.exception("Ошибка при форматировании")
         await update.message.reply_text(f"Ошибка: {e}")
-    context.user_data.pop("fmt_text", None)
-    return ConversationHandler.END
+        return ConversationHandler.END
+    await update.message.reply_text(
+        "Можно ввести другое N — текст заново присылать не нужно. /reset — выход в меню."
+    )
+    return FMT_N
 
 # ========================== ТОНАЛЬНОСТЬ (/tonalnost) ==========================
 async def tonalnost_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -250,24 +431,174 @@ async def tonalnost_process(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 # ========================== ОБЩЕЕ ==========================
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    context.user_data.clear()
+    SESSIONS.drop(update.effective_user.id)
     await update.message.reply_text("⛔ Операция отменена.")
     return ConversationHandler.END
 
 async def reset(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    context.user_data.clear()
     await start(update, context)
     return ConversationHandler.END
 
+async def _end_conversation(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Молча закрываем диалог: ответит обработчик этой команды в своей группе
+    return ConversationHandler.END
+
+def _exit_fallbacks(*commands: str) -> list:
+    """/cancel, а также /start, /reset и команды других режимов завершают диалог."""
+    return [
+        CommandHandler("cancel", cancel),
+        CommandHandler(["start", "reset", *commands], _end_conversation),
+    ]
+
 async def on_error(update: object, context: ContextTypes.DEFAULT_TYPE):
     logger.exception("Unhandled exception", exc_info=context.error)
 
+# ========================== СОСТОЯНИЕ ДИАЛОГОВ ==========================
+def _read_state(path: Path) -> dict:
+    """Читает файл состояния; при любой ошибке — пустое состояние, бот всё равно стартует."""
+    try:
+        with open(path, "rb") as f:
+            data = pickle.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception:
+        logger.exception("Не удалось загрузить состояние из %s", path)
+        return {}
+    if not isinstance(data, dict):
+        logger.error("Неожиданный формат состояния в %s", path)
+        return {}
+    return data
+
+def _write_state(path: Path, data: dict) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+class _StatePersistence(BasePersistence):
+    """
+    Шаги диалогов и данные SESSIONS — в одном файле и за одну запись, поэтому
+    они не расходятся. Пишем только во flush(): по таймеру и при остановке;
+    сериализация и запись идут в отдельном потоке, не блокируя цикл событий.
+    user_data/chat_data/bot_data/callback_data не храним.
+    """
+
+    def __init__(self, filepath: str, sessions: SessionStore):
+        super().__init__(
+            store_data=PersistenceInput(
+                bot_data=False, chat_data=False, user_data=False, callback_data=False
+            ),
+        )
+        self.filepath = Path(filepath)
+        self.sessions = sessions
+        self._flush_lock = asyncio.Lock()
+        data = _read_state(self.filepath)
+        conversations = data.get("conversations", {})
+        self.conversations: dict = conversations if isinstance(conversations, dict) else {}
+        self._written = deepcopy(self.conversations)
+        try:
+            sessions.restore(data.get("sessions", []))
+        except Exception:
+            logger.exception("Не удалось восстановить сессии из %s", self.filepath)
+
+    async def get_conversations(self, name: str) -> dict:
+        return self.conversations.get(name, {}).copy()
+
+    async def update_conversation(self, name: str, key: tuple, new_state: object | None) -> None:
+        if new_state is None:
+            self.conversations.get(name, {}).pop(key, None)
+        else:
+            self.conversations.setdefault(name, {})[key] = new_state
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            if not self.sessions.dirty and self.conversations == self._written:
+                return
+            conversations = deepcopy(self.conversations)
+            data = {"conversations": conversations, "sessions": self.sessions.snapshot()}
+            try:
+                await asyncio.to_thread(_write_state, self.filepath, data)
+            except Exception:
+                logger.exception("Не удалось сохранить состояние в %s", self.filepath)
+                self.sessions.dirty = True
+                return
+            self._written = conversations
+
+    # Остальные данные PTB выключены в store_data — хранить нечего
+    async def get_user_data(self) -> dict:
+        return {}
+
+    async def get_chat_data(self) -> dict:
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        pass
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        pass
+
+    async def update_bot_data(self, data: dict) -> None:
+        pass
+
+    async def update_callback_data(self, data: object) -> None:
+        pass
+
+    async def drop_user_data(self, user_id: int) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
+
+async def _housekeeping(app: Application) -> None:
+    while True:
+        await asyncio.sleep(HOUSEKEEPING_INTERVAL)
+        # Ошибка одного прохода не должна останавливать вытеснение, отчёты и сохранение
+        try:
+            SESSIONS.evict_idle()
+            if SESSIONS.stats():
+                logger.info("Сессии: %s", SESSIONS.report())
+            if app.persistence:
+                await app.update_persistence()
+                await app.persistence.flush()
+        except Exception:
+            logger.exception("Ошибка фонового обслуживания сессий")
+
+async def _post_init(app: Application) -> None:
+    global _housekeeping_task
+    _housekeeping_task = asyncio.create_task(_housekeeping(app))
+
+async def _post_stop(app: Application) -> None:
+    # Финальную запись делает сам Application.stop() через flush()
+    if _housekeeping_task:
+        _housekeeping_task.cancel()
+
 def build_app() -> Application:
     token = os.getenv("BOT_TOKEN")
     if not token:
         raise RuntimeError("BOT_TOKEN is not set")
-    app = Application.builder().token(token).build()
+    builder = Application.builder().token(token).post_init(_post_init).post_stop(_post_stop)
+    if _STATE_PATH:
+        builder = builder.persistence(_StatePersistence(_STATE_PATH, SESSIONS))
+    app = builder.build()
+    register_handlers(app)
+    return app
 
+def register_handlers(app: Application) -> None:
     # Группировка
     conv_pack = ConversationHandler(
         entry_points=[CommandHandler("gpupirovka", gpupirovka_start)],
@@ -278,11 +609,11 @@ def build_app() -> Application:
             MAXLEN: [MessageHandler(filters.TEXT & ~filters.COMMAND, maxlen_input)],
             SEPARATOR: [MessageHandler(filters.TEXT & ~filters.COMMAND, separator_input)],
         },
-        fallbacks=[CommandHandler("cancel", cancel), CommandHandler("reset", reset), CommandHandler("start", start)],
+        fallbacks=_exit_fallbacks("podbor", "format", "tonalnost"),
         allow_reentry=True,
-        conversation_timeout=600,
+        conversation_timeout=CONVERSATION_TIMEOUT,
         name="conv_pack",
-        persistent=False,
+        persistent=bool(_STATE_PATH),
     )
 
     # Форматирование
@@ -295,33 +626,51 @@ def build_app() -> Application:
             ],
             FMT_N: [MessageHandler(filters.TEXT & ~filters.COMMAND, fmt_n_input)],
         },
-        fallbacks=[CommandHandler("cancel", cancel), CommandHandler("reset", reset), CommandHandler("start", start)],
+        fallbacks=_exit_fallbacks("gpupirovka", "podbor", "tonalnost"),
         allow_reentry=True,
-        conversation_timeout=600,
+        conversation_timeout=CONVERSATION_TIMEOUT,
         name="conv_fmt",
-        persistent=False,
+        persistent=bool(_STATE_PATH),
     )
 
     # Тональность
     conv_ton = ConversationHandler(
         entry_points=[CommandHandler("tonalnost", tonalnost_start)],
         states={TON_TEXT: [MessageHandler(filters.TEXT & ~filters.COMMAND, tonalnost_process)]},
-        fallbacks=[CommandHandler("cancel", cancel), CommandHandler("reset", reset), CommandHandler("start", start)],
+        fallbacks=_exit_fallbacks("gpupirovka", "podbor", "format"),
         allow_reentry=True,
-        conversation_timeout=600,
+        conversation_timeout=CONVERSATION_TIMEOUT,
         name="conv_ton",
-        persistent=False,
+        persistent=bool(_STATE_PATH),
     )
 
-    # Глобальные команды
+    # Подбор параметров
+    conv_sweep = ConversationHandler(
+        entry_points=[CommandHandler("podbor", sweep_start)],
+        states={
+            SW_LEFT: [MessageHandler(filters.TEXT & ~filters.COMMAND, sweep_left_input)],
+            SW_RIGHT: [MessageHandler(filters.TEXT & ~filters.COMMAND, sweep_right_input)],
+            SW_MIN: [MessageHandler(filters.TEXT & ~filters.COMMAND, sweep_min_input)],
+            SW_MAX: [MessageHandler(filters.TEXT & ~filters.COMMAND, sweep_max_input)],
+            SW_SEP: [MessageHandler(filters.TEXT & ~filters.COMMAND, sweep_sep_input)],
+        },
+        fallbacks=_exit_fallbacks("gpupirovka", "format", "tonalnost"),
+        allow_reentry=True,
+        conversation_timeout=CONVERSATION_TIMEOUT,
+        name="conv_sweep",
+        persistent=bool(_STATE_PATH),
+    )
+
+    # Глобальные команды. Каждый диалог — в своей группе: команда другого режима
+    # сначала закрывает текущий диалог (fallback), затем запускает новый (entry point)
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("reset", reset))
-    app.add_handler(conv_ton)
-    app.add_handler(conv_fmt)
-    app.add_handler(conv_pack)
+    app.add_handler(conv_ton, group=1)
+    app.add_handler(conv_fmt, group=2)
+    app.add_handler(conv_pack, group=3)
+    app.add_handler(conv_sweep, group=4)
 
     app.add_error_handler(on_error)
-    return app
 
 def main():
     app = build_app()
@@ -0,0 +1,209 @@
+# session_store.py — компактное хранилище состояния незавершённых диалогов:
+# 1) Списки токенов хранятся одним буфером UTF-8 + массивом смещений.
+# 2) Простаивающие сессии вытесняются по таймауту, при превышении общего лимита
+#    памяти — самые давние (LRU).
+# 3) Учёт памяти по каждой сессии и в сумме.
+# 4) Снимок/восстановление для сохранения на диск (сам файл пишет bot.py).
+
+from __future__ import annotations
+import logging
+import sys
+import time
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class _Tokens:
+    """Список строк: один буфер байтов + концы элементов в буфере."""
+
+    __slots__ = ("buf", "ends")
+
+    def __init__(self, tokens: List[str]):
+        encoded = [t.encode("utf-8") for t in tokens]
+        self.buf = b"".join(encoded)
+        self.ends = array("I")
+        pos = 0
+        for b in encoded:
+            pos += len(b)
+            self.ends.append(pos)
+
+    def to_list(self) -> List[str]:
+        out: List[str] = []
+        start = 0
+        for end in self.ends:
+            out.append(self.buf[start:end].decode("utf-8"))
+            start = end
+        return out
+
+    def nbytes(self) -> int:
+        return len(self.buf) + len(self.ends) * self.ends.itemsize
+
+
+def _value_size(value: Any) -> int:
+    if isinstance(value, _Tokens):
+        return value.nbytes()
+    return sys.getsizeof(value)
+
+
+class _Session:
+    __slots__ = ("values", "touched", "size")
+
+    def __init__(self):
+        self.values: Dict[str, Any] = {}
+        self.touched = time.monotonic()
+        self.size = 0
+
+
+class SessionStore:
+    """
+    Состояние диалогов по id пользователя.
+    idle_ttl — через сколько секунд простоя сессия удаляется;
+    max_bytes — общий лимит памяти на все сессии.
+    Значения _Tokens после записи не меняются, поэтому снимок можно
+    сериализовать вне цикла событий.
+    """
+
+    def __init__(self, idle_ttl: float = 600, max_bytes: int = 64 * 1024 * 1024):
+        self.idle_ttl = idle_ttl
+        self.max_bytes = max_bytes
+        self._sessions: "OrderedDict[int, _Session]" = OrderedDict()
+        self._total = 0
+        self.dirty = False  # были изменения после последнего snapshot()
+
+    # ---------------------------- Запись/чтение ----------------------------
+
+    def put(self, uid: int, key: str, value: Any) -> None:
+        """Сохраняет небольшое значение (число, строку) как есть."""
+        self._set(uid, key, value)
+
+    def get(self, uid: int, key: str, default: Any = None) -> Any:
+        value = self._get(uid, key)
+        return default if value is None else value
+
+    def put_tokens(self, uid: int, key: str, tokens: List[str]) -> None:
+        self._set(uid, key, _Tokens(tokens))
+
+    def get_tokens(self, uid: int, key: str) -> List[str]:
+        value = self._get(uid, key)
+        return value.to_list() if value is not None else []
+
+    def pop(self, uid: int, key: str) -> None:
+        sess = self._sessions.get(uid)
+        if sess is None or key not in sess.values:
+            return
+        old = sess.values.pop(key)
+        self._resize(sess, -_value_size(old))
+        self.dirty = True
+
+    def drop(self, uid: int) -> None:
+        """Удаляет всю сессию пользователя."""
+        sess = self._sessions.pop(uid, None)
+        if sess is not None:
+            self._total -= sess.size
+            self.dirty = True
+
+    # ---------------------------- Учёт памяти ----------------------------
+
+    def stats(self) -> Dict[int, int]:
+        """Размер данных (байт) по каждой сессии."""
+        return {uid: sess.size for uid, sess in self._sessions.items()}
+
+    def report(self, top: int = 5) -> str:
+        """Строка для лога: число сессий, общий размер и самые крупные сессии."""
+        largest = sorted(self.stats().items(), key=lambda kv: kv[1], reverse=True)[:top]
+        parts = ", ".join(f"{uid}={size}" for uid, size in largest)
+        return (
+            f"{len(self._sessions)} шт., всего {self._total} байт"
+            f" (лимит {self.max_bytes}); крупнейшие: {parts or '—'}"
+        )
+
+    # ---------------------------- Вытеснение ----------------------------
+
+    def evict_idle(self) -> int:
+        """Удаляет сессии, простаивающие дольше idle_ttl. Возвращает их количество."""
+        deadline = time.monotonic() - self.idle_ttl
+        evicted = 0
+        # OrderedDict упорядочен по последнему обращению — старые в начале
+        while self._sessions:
+            uid, sess = next(iter(self._sessions.items()))
+            if sess.touched > deadline:
+                break
+            self._sessions.popitem(last=False)
+            self._total -= sess.size
+            evicted += 1
+        if evicted:
+            self.dirty = True
+            logger.info("Сессии: вытеснено по простою %d, всего %d байт", evicted, self._total)
+        return evicted
+
+    def _evict_over_cap(self, keep: int) -> None:
+        evicted = 0
+        while self._total > self.max_bytes and len(self._sessions) > 1:
+            uid, sess = next(iter(self._sessions.items()))
+            if uid == keep:
+                self._sessions.move_to_end(uid)
+                continue
+            self._sessions.popitem(last=False)
+            self._total -= sess.size
+            evicted += 1
+        if evicted:
+            self.dirty = True
+            logger.info("Сессии: вытеснено по лимиту %d, всего %d байт", evicted, self._total)
+
+    # ---------------------------- Внутреннее ----------------------------
+
+    def _touch(self, uid: int, create: bool) -> Optional[_Session]:
+        self.evict_idle()
+        sess = self._sessions.get(uid)
+        if sess is None:
+            if not create:
+                return None
+            sess = _Session()
+            self._sessions[uid] = sess
+        sess.touched = time.monotonic()
+        self._sessions.move_to_end(uid)
+        return sess
+
+    def _resize(self, sess: _Session, delta: int) -> None:
+        sess.size += delta
+        self._total += delta
+
+    def _set(self, uid: int, key: str, value: Any) -> None:
+        sess = self._touch(uid, create=True)
+        old = sess.values.get(key)
+        delta = _value_size(value) - (_value_size(old) if old is not None else 0)
+        sess.values[key] = value
+        self._resize(sess, delta)
+        self._evict_over_cap(keep=uid)
+        self.dirty = True
+
+    def _get(self, uid: int, key: str) -> Any:
+        sess = self._touch(uid, create=False)
+        return sess.values.get(key) if sess else None
+
+    # ---------------------------- Сохранение ----------------------------
+
+    def snapshot(self) -> List[Tuple[int, float, Dict[str, Any]]]:
+        """
+        Дешёвый снимок для сохранения: (uid, возраст сессии, копия значений).
+        time.monotonic не переживает перезапуск — поэтому храним возраст.
+        """
+        now = time.monotonic()
+        self.dirty = False
+        return [(uid, now - s.touched, dict(s.values)) for uid, s in self._sessions.items()]
+
+    def restore(self, data: List[Tuple[int, float, Dict[str, Any]]]) -> None:
+        """Восстанавливает сессии из snapshot(); просроченные сразу вытесняются."""
+        now = time.monotonic()
+        for uid, age, values in data:
+            sess = _Session()
+            sess.values = values
+            sess.touched = now - age
+            sess.size = sum(_value_size(v) for v in values.values())
+            self._sessions[uid] = sess
+            self._total += sess.size
+        self.evict_idle()
+        self.dirty = False
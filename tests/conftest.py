@@ -0,0 +1,80 @@
+# conftest.py — приложение бота без сети: ответы Bot API подменяются FakeRequest
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+import pytest
+from telegram import Update
+from telegram.ext import Application
+from telegram.request import BaseRequest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import bot  # noqa: E402
+
+USER = {"id": 7, "is_bot": False, "first_name": "Test"}
+CHAT = {"id": 7, "type": "private"}
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Bot", "username": "test_bot"}
+
+
+class FakeRequest(BaseRequest):
+    """Отвечает на getMe/sendMessage и запоминает тексты ответов бота."""
+
+    def __init__(self):
+        self.sent: list[str] = []
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, *args, **kwargs):
+        endpoint = url.rsplit("/", 1)[-1]
+        if endpoint == "getMe":
+            result = BOT_USER
+        elif endpoint.startswith("send"):
+            # Документы записываем как "<document>", чтобы видеть каждый ответ бота
+            text = request_data.parameters.get("text", "<document>")
+            self.sent.append(text)
+            result = {"message_id": len(self.sent), "date": 0, "chat": CHAT, "from": BOT_USER}
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+class Chat:
+    """Переписка одного пользователя с ботом через Application.process_update."""
+
+    def __init__(self, app: Application, request: FakeRequest):
+        self.app = app
+        self.request = request
+        self._update_id = 0
+
+    def send(self, text: str) -> list[str]:
+        """Отправляет сообщение и возвращает все ответы бота на него."""
+        self._update_id += 1
+        message = {"message_id": self._update_id, "date": 0, "chat": CHAT, "from": USER, "text": text}
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        update = Update.de_json({"update_id": self._update_id, "message": message}, self.app.bot)
+        before = len(self.request.sent)
+        asyncio.run(self.app.process_update(update))
+        assert len(self.request.sent) > before, f"бот не ответил на {text!r}"
+        return self.request.sent[before:]
+
+
+@pytest.fixture
+def chat():
+    request = FakeRequest()
+    app = Application.builder().token("1:TEST").request(request).get_updates_request(FakeRequest()).build()
+    bot.register_handlers(app)
+    asyncio.run(app.initialize())
+    bot.SESSIONS.drop(USER["id"])
+    yield Chat(app, request)
+    asyncio.run(app.shutdown())
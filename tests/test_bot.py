@@ -0,0 +1,56 @@
+# test_bot.py — переключение между режимами бота
+
+
+def _finish_format(chat):
+    """/format до результата: диалог остаётся открытым и ждёт новое N."""
+    chat.send("/format")
+    chat.send("a b, c")
+    assert "другое N" in chat.send("1")[-1]
+
+
+def test_format_then_gpupirovka(chat):
+    _finish_format(chat)
+    assert "ЛЕВУЮ" in chat.send("/gpupirovka")[-1]
+    replies = chat.send("alpha, beta")
+    assert len(replies) == 1 and "ПРАВУЮ" in replies[0]
+
+
+def test_format_then_podbor(chat):
+    _finish_format(chat)
+    chat.send("/podbor")
+    replies = chat.send("alpha, beta")
+    assert len(replies) == 1 and "ПРАВУЮ" in replies[0]
+
+
+def test_format_then_tonalnost(chat):
+    _finish_format(chat)
+    assert "НОРМАЛИЗАЦИИ" in chat.send("/tonalnost")[-1]
+    replies = chat.send("сотрудники")
+    assert replies[0] == "сотрудник"
+    assert not any("Ошибка" in r for r in replies)
+
+
+def test_gpupirovka_then_podbor(chat):
+    """Незавершённая группировка не перехватывает ввод /podbor."""
+    chat.send("/gpupirovka")
+    chat.send("x")
+    chat.send("/podbor")
+    assert chat.send("a") == ["Теперь введи ПРАВУЮ часть (плавающий список слов):"]
+    replies = chat.send("b")
+    assert len(replies) == 1 and "диапазон min_len" in replies[0]
+
+
+def test_podbor_then_gpupirovka(chat):
+    chat.send("/podbor")
+    chat.send("x")
+    chat.send("/gpupirovka")
+    assert chat.send("a") == ["Отлично! Теперь введи ПРАВУЮ часть (плавающий список слов):"]
+    replies = chat.send("b")
+    assert len(replies) == 1 and "минимальную длину" in replies[0]
+
+
+def test_gpupirovka_then_format(chat):
+    chat.send("/gpupirovka")
+    chat.send("/format")
+    replies = chat.send("a b, c")
+    assert len(replies) == 1 and "число N" in replies[0]
@@ -1,7 +1,11 @@
 # text_formatter.py — форматирование входного текста под правило "фразы" -> "..."~N
 import re
 from pathlib import Path
-from typing import Tuple
+from typing import List, Tuple
+
+_TRAILING_PUNCT_RE = re.compile(r"[\.!\?;:…]+$")
+_DASH_RE = re.compile(r"[-–—_]")
+_MULTISPACE_RE = re.compile(r"\s+")
 
 
 def load_text(path: Path) -> str:
@@ -13,8 +17,8 @@ def load_text(path: Path) -> str:
     return path.read_text(encoding="utf-8").strip()
 
 
-def transform_item(item: str, n: int) -> str | None:
-    """Очищает и преобразует элемент согласно правилам."""
+def clean_item(item: str) -> str | None:
+    """Очищает элемент: кавычки, завершающая пунктуация, дефисы, пробелы."""
     if not item:
         return None
 
@@ -25,27 +29,52 @@ def transform_item(item: str, n: int) -> str | None:
         s = s[1:-1].strip()
 
     # Убираем завершающую пунктуацию (. ! ? ; : …)
-    s = re.sub(
-        r"""[\.!\?;:…]+$""",
-        "",
-        s,
-        flags=re.VERBOSE,
-    )
+    s = _TRAILING_PUNCT_RE.sub("", s)
 
     # Заменяем дефисы, тире и подчеркивания на пробел
-    s = re.sub(r"[-–—_]", " ", s)
+    s = _DASH_RE.sub(" ", s)
 
     # Схлопываем пробелы
-    s = re.sub(r"\s+", " ", s).strip()
+    s = _MULTISPACE_RE.sub(" ", s).strip()
+
+    return s or None
 
-    if not s:
-        return None
 
+def render_item(s: str, is_phrase: bool, n: int) -> str:
+    """Оформляет очищенный элемент: фраза -> "..."~N, слово — как есть."""
+    return f"\"{s}\"~{n}" if is_phrase else s
+
+
+def transform_item(item: str, n: int) -> str | None:
+    """Очищает и преобразует элемент согласно правилам."""
+    s = clean_item(item)
+    if s is None:
+        return None
     # Проверяем количество слов
-    if " " in s:  # минимум два слова
-        return f"\"{s}\"~{n}"
-    else:
-        return s
+    return render_item(s, " " in s, n)  # минимум два слова — фраза
+
+
+def parse_text(text: str) -> Tuple[List[str], bytes]:
+    """
+    Шаг разбора: очищенные элементы и флаги (1 — фраза, 0 — одиночное слово).
+    Не зависит от N, поэтому результат можно рендерить много раз.
+    """
+    items: List[str] = []
+    flags = bytearray()
+    for item in text.split(","):
+        s = clean_item(item)
+        if s is None:
+            continue
+        items.append(s)
+        flags.append(1 if " " in s else 0)
+    return items, bytes(flags)
+
+
+def render_text(items: List[str], flags: bytes, n: int) -> Tuple[str, int, int, int]:
+    """Шаг рендера: применяет N к разобранным элементам -> (result, total, phrases, singles)."""
+    result = ", ".join(render_item(s, bool(f), n) for s, f in zip(items, flags))
+    phrases = sum(flags)
+    return result, len(items), phrases, len(items) - phrases
 
 
 def process_text(text: str, n: int) -> Tuple[str, int, int, int]:
@@ -53,24 +82,8 @@ def process_text(text: str, n: int) -> Tuple[str, int, int, int]:
     Обрабатывает весь текст и возвращает (result, total, phrases, singles).
     Разделитель элементов — запятая.
     """
-    items = [x.strip() for x in text.split(",")]
-
-    result_items = []
-    phrases = 0
-    singles = 0
-
-    for item in items:
-        transformed = transform_item(item, n)
-        if transformed is None:
-            continue
-        result_items.append(transformed)
-        if transformed.startswith('"'):
-            phrases += 1
-        else:
-            singles += 1
-
-    result = ", ".join(result_items)
-    return result, len(result_items), phrases, singles
+    items, flags = parse_text(text)
+    return render_text(items, flags, n)
 
 
 def save_text(path: Path, text: str) -> Path:
@@ -1,5 +1,5 @@
 # token_packer.py — логика упаковки с нормализацией и валидациями
-from typing import List
+from typing import Iterable, List, NamedTuple, Optional, Tuple
 
 
 # ---------------------------- Нормализация ----------------------------
@@ -39,46 +39,62 @@ def len_sep_construct(llen: int, rlen: int, sep_len: int) -> int:
 
 # ---------------------------- Разбиение правой части ----------------------------
 
-def split_right_tokens(
-    right: List[str],
+def _group_bounds(
+    tok_lens: List[int],
     left_len: int,
     min_len: int,
     max_len: int,
     sep_len: int,
-    inner_sep: str = ",",
-) -> List[str]:
+    inner_len: int,
+) -> List[Tuple[int, int, int]]:
     """
-    Стратегия flush_on_min: как только достигли min_len — флашим группу.
-    Гарантирует, что каждая группа <= max_len, старается быть >= min_len.
+    Жадная группировка по одним длинам токенов.
+    Возвращает (начало, конец, длина правой части) для каждой группы.
     """
-    results: List[str] = []
-    buffer: List[str] = []
+    bounds: List[Tuple[int, int, int]] = []
+    start = 0
     buffer_len = 0
 
-    for tok in right:
-        tok_len = len(tok)
-        extra = len(inner_sep) if buffer else 0
+    for i, tok_len in enumerate(tok_lens):
+        extra = inner_len if i > start else 0
         projected_rlen = buffer_len + extra + tok_len
         projected_total = len_sep_construct(left_len, projected_rlen, sep_len)
 
         if projected_total > max_len:
-            if buffer:
-                results.append(inner_sep.join(buffer))
-            buffer = [tok]
+            if i > start:
+                bounds.append((start, i, buffer_len))
+            start = i
             buffer_len = tok_len
         else:
-            buffer.append(tok)
             buffer_len = projected_rlen
 
             if len_sep_construct(left_len, buffer_len, sep_len) >= min_len:
-                results.append(inner_sep.join(buffer))
-                buffer = []
+                bounds.append((start, i + 1, buffer_len))
+                start = i + 1
                 buffer_len = 0
 
-    if buffer:
-        results.append(inner_sep.join(buffer))
+    if start < len(tok_lens):
+        bounds.append((start, len(tok_lens), buffer_len))
+
+    return bounds
+
 
-    return results
+def split_right_tokens(
+    right: List[str],
+    left_len: int,
+    min_len: int,
+    max_len: int,
+    sep_len: int,
+    inner_sep: str = ",",
+) -> List[str]:
+    """
+    Стратегия flush_on_min: как только достигли min_len — флашим группу.
+    Гарантирует, что каждая группа <= max_len, старается быть >= min_len.
+    """
+    bounds = _group_bounds(
+        [len(t) for t in right], left_len, min_len, max_len, sep_len, len(inner_sep)
+    )
+    return [inner_sep.join(right[i:j]) for i, j, _ in bounds]
 
 
 # ---------------------------- Основная сборка ----------------------------
@@ -126,3 +142,64 @@ def pack(
         result.append(construction)
 
     return result
+
+
+# ---------------------------- Подбор параметров ----------------------------
+
+class SweepRow(NamedTuple):
+    min_len: int
+    max_len: int
+    separator: str
+    count: int               # число конструкций (0 — если комбинация невозможна)
+    mean_fill: float         # средняя длина конструкции / max_len
+    longest: int             # максимальная длина конструкции
+    error: Optional[str] = None
+
+
+def sweep(
+    left_tokens: List[str],
+    right_tokens: List[str],
+    min_lens: Iterable[int],
+    max_lens: Iterable[int],
+    separators: Iterable[str],
+) -> List[SweepRow]:
+    """
+    Перебирает все комбинации min_len/max_len/разделителя без сборки строк:
+    длины токенов считаются один раз и переиспользуются.
+    Группировка совпадает с pack() для тех же параметров.
+    """
+    left_tokens = preprocess(left_tokens)
+    right_tokens = preprocess(right_tokens)
+
+    if not left_tokens:
+        raise ValueError("Левая часть пуста")
+    if not right_tokens:
+        raise ValueError("Правая часть пуста")
+
+    llen = len(",".join(left_tokens))
+    tok_lens = [len(t) for t in right_tokens]
+    longest_tok = max(tok_lens)
+    min_lens = list(min_lens)
+    max_lens = list(max_lens)
+    separators = list(separators)
+
+    rows: List[SweepRow] = []
+    for sep in separators:
+        sep_len = len(sep)
+        for min_len in min_lens:
+            for max_len in max_lens:
+                if min_len > max_len:
+                    continue
+                if len_sep_construct(llen, longest_tok, sep_len) > max_len:
+                    rows.append(SweepRow(
+                        min_len, max_len, sep, 0, 0.0, 0,
+                        f"токен длиной {longest_tok} не помещается в max_len",
+                    ))
+                    continue
+                bounds = _group_bounds(tok_lens, llen, min_len, max_len, sep_len, 1)
+                totals = [len_sep_construct(llen, rlen, sep_len) for _, _, rlen in bounds]
+                rows.append(SweepRow(
+                    min_len, max_len, sep, len(totals),
+                    sum(totals) / len(totals) / max_len, max(totals),
+                ))
+    return rows